@@ -1,4 +1,7 @@
 """Solara visualization of the model"""
+from collections.abc import Mapping
+from types import MappingProxyType
+import solara
 from mesa import Agent
 from mesa.visualization import make_plot_component
 from transport_model.model import TransportModel
@@ -8,30 +11,37 @@ from utils.viz_components import info_panel
 from modified_lib_files.custom_geospace_component import make_geospace_component
 from modified_lib_files.custom_solara_viz import SolaraViz
 
-def draw(agent: Agent) -> dict:
+# Portrayals are shared between agents, so they're read-only
+# (the geospace component copies them before making changes)
+PERSON = MappingProxyType({"color": "red"})
+SELECTED_PERSON = MappingProxyType({"color": "brown"})
+ROAD = MappingProxyType({"color": "grey"})
+ROAD_WITH_INFO = MappingProxyType({"color": "yellow"})
+DEFAULT = MappingProxyType({})
+
+# Portrayals for agents that are always drawn the same way, indexed by agent class
+PORTRAYALS = {
+    Area: MappingProxyType({"stroke": False}),
+    ResidentialArea: MappingProxyType({"stroke": False, "color": "green"}),
+    RetailArea: MappingProxyType({"stroke": False, "color": "blue"}),
+    IndustrialArea: MappingProxyType({"stroke": False, "color": "yellow"}),
+}
+
+def draw(agent: Agent) -> Mapping:
     """Defines how a given agent should be represented"""
-    portrayal = {}
+    portrayal = PORTRAYALS.get(type(agent))
+    if portrayal is not None:
+        return portrayal
 
     if isinstance(agent, PersonAgent):
-        if agent.model.selected_agent == agent:
-            portrayal["color"] = "brown"
-        else:
-            portrayal["color"] = "red"
-    elif isinstance(agent, NetworkLink):
-        if hasattr(agent, "extra_info") and isinstance(agent.extra_info, str):
-            portrayal["color"] = "yellow"
-        else:
-            portrayal["color"] = "grey"
-    elif isinstance(agent, Area):
-        portrayal["stroke"] = False
-        if isinstance(agent, ResidentialArea):
-            portrayal["color"] = "green"
-        elif isinstance(agent, RetailArea):
-            portrayal["color"] = "blue"
-        elif isinstance(agent, IndustrialArea):
-            portrayal["color"] = "yellow"
-
-    return portrayal
+        if agent.model.selected_agent is agent:
+            return SELECTED_PERSON
+        return PERSON
+    if isinstance(agent, NetworkLink):
+        if isinstance(getattr(agent, "extra_info", None), str):
+            return ROAD_WITH_INFO
+        return ROAD
+    return DEFAULT
 
 mode_plot = make_plot_component(["num_driving", "num_walking", "num_cycling"])
 
@@ -59,25 +69,37 @@ model_params = {
     "cycling_extra_time": 5
 }
 
-transport_model = TransportModel(
-    model_params["scenario"],
-    model_params["time_step"]["value"],
-    model_params["default_speed_limit"],
-    model_params["car_speed_factor"],
-    model_params["n_days"]["value"],
-    model_params["driving_extra_time"],
-    model_params["cycling_extra_time"]
-)
+def build_model() -> TransportModel:
+    """Creates a model using the default parameter values"""
+    return TransportModel(
+        model_params["scenario"],
+        model_params["time_step"]["value"],
+        model_params["default_speed_limit"],
+        model_params["car_speed_factor"],
+        model_params["n_days"]["value"],
+        model_params["driving_extra_time"],
+        model_params["cycling_extra_time"]
+    )
+
+@solara.component
+def Page():
+    """
+    The visualization page.
+    The model is only created when the page is first rendered,
+    so importing this module doesn't load the scenario.
+    """
+    transport_model = solara.use_memo(build_model, [])
+    SolaraViz(
+        transport_model,
+        name="Transport Model",
+        model_params=model_params,
+        components=[
+            make_geospace_component(draw),
+            info_panel,
+            mode_plot,
+        ],
+    )
 
-page = SolaraViz(
-    transport_model,
-    name="Transport Model",
-    model_params=model_params,
-    components=[
-        make_geospace_component(draw),
-        info_panel,
-        mode_plot,
-    ],
-)
+page = Page()
 # This is required to render the visualization in the Jupyter notebook
 page
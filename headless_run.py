@@ -1,15 +1,86 @@
 """Script to run the model without the visualisation"""
+import argparse
+import cProfile
+import pstats
+from concurrent.futures import ProcessPoolExecutor
 from transport_model.model import TransportModel
 
-model = TransportModel(
-    scenario = "westerham",
-    time_step = 5,
-    default_speed_limit = 30,
-    car_speed_factor = 0.75,
-    n_days = 10,
-    driving_extra_time = 5,
-    cycling_extra_time = 5
-)
+def create_model() -> TransportModel:
+    """Creates a model with the parameters used for headless runs"""
+    return TransportModel(
+        scenario = "westerham",
+        time_step = 5,
+        default_speed_limit = 30,
+        car_speed_factor = 0.75,
+        n_days = 10,
+        driving_extra_time = 5,
+        cycling_extra_time = 5
+    )
+
+def run_with_profiler(model: TransportModel, out_path: str | None) -> None:
+    """
+    Runs the model under cProfile and prints the functions with the highest cumulative time.
+
+    Args:
+        model: The model to run.
+        out_path: (Optional) file to save the raw profiling stats to,
+                  e.g. to view as a flame graph with snakeviz.
+    """
+    with cProfile.Profile() as profiler:
+        model.run_model()
+    stats = pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE)
+    stats.print_stats(30)
+    if out_path is not None:
+        stats.dump_stats(out_path)
+
+def run_once(_run: int) -> None:
+    """Creates and runs a model (used as the task for worker processes)"""
+    create_model().run_model()
+
+def run_in_parallel(n_runs: int, n_workers: int) -> None:
+    """
+    Runs several independent replications of the model at once, each in its own process.
+    Each run writes its own journeys file, so results can be compared across runs.
+
+    Args:
+        n_runs: The number of runs.
+        n_workers: The maximum number of runs at once.
+    """
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        # list() so that errors in runs are raised here
+        list(executor.map(run_once, range(n_runs)))
 
 if __name__ == "__main__":
-    model.run_model()
+    parser = argparse.ArgumentParser(description="Runs the model without the visualisation")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the run and print the most expensive functions"
+    )
+    parser.add_argument(
+        "--out",
+        help="file to save profiling stats to (only used with --profile)"
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=1,
+        help="number of independent runs of the model"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of runs to do at once, each in its own process"
+    )
+    args = parser.parse_args()
+    if args.profile and args.runs > 1:
+        parser.error("--profile can only be used for a single run")
+
+    if args.profile:
+        run_with_profiler(create_model(), args.out)
+    elif args.workers > 1:
+        run_in_parallel(args.runs, args.workers)
+    else:
+        for _ in range(args.runs):
+            create_model().run_model()
@@ -1,38 +1,147 @@
 """Handles calls to the large language model"""
 import os
+import re
+import asyncio
+import hashlib
 import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from sqlite3 import Connection, Cursor
-from openai import OpenAI
+import httpx
+import zstandard as zstd
+from openai import OpenAI, AsyncOpenAI
+
+# Keep connections to the LLM server open between requests
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+# Same as the openai default (an explicit http client doesn't inherit it)
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
 
 client = OpenAI(
     base_url = 'http://localhost:1234/v1/',
-    api_key = 'foo'
+    api_key = 'foo',
+    http_client = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
 )
 
+# Number of responses kept in memory on top of the cache database
+MEMO_SIZE = 4096
+
+# Maximum number of requests sent to the LLM at once by generate_responses
+MAX_CONCURRENT_REQUESTS = 8
+
+# Statements used to read from and write to the cache
+_SELECT_SQL = "SELECT response FROM cache WHERE key=?"
+_INSERT_SQL = "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)"
+_DELETE_SQL = "DELETE FROM cache WHERE key=?"
+
+# Responses are stored zstd-compressed, using a dictionary trained on
+# earlier responses if one exists (see train_dict.py)
+DICT_PATH = "./llm/dict.bin"
+COMPRESSION_LEVEL = 3
+
+# Matches the input placeholders in prompt templates e.g. <INPUT 0>
+_INPUT_PATTERN = re.compile(r"<INPUT (\d+)>")
+
+# Each thread keeps one open connection to the cache database
+# (and its own compressor + decompressor, which aren't thread safe)
+_local = threading.local()
+_memo: OrderedDict[bytes, str] = OrderedDict()
+_memo_lock = threading.Lock()
+
+def _key(system_prompt: str, content: str) -> bytes:
+    """Returns the cache key (a hash of the full prompt) for the given prompt"""
+    prompt = system_prompt + "\x00" + content
+    return hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+
+@lru_cache(maxsize=1)
+def _load_dict() -> zstd.ZstdCompressionDict | None:
+    """Loads the compression dictionary, if one has been trained"""
+    if not os.path.exists(DICT_PATH):
+        return None
+    with open(DICT_PATH, "rb") as f:
+        return zstd.ZstdCompressionDict(f.read())
+
+def _get_compressors() -> tuple[zstd.ZstdCompressor, zstd.ZstdDecompressor]:
+    """Returns this thread's compressor and decompressor for cached responses"""
+    if not hasattr(_local, "cctx"):
+        dict_data = _load_dict()
+        _local.cctx = zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dict_data)
+        _local.dctx = zstd.ZstdDecompressor(dict_data=dict_data)
+    return _local.cctx, _local.dctx
+
+def encode_response(response: str) -> bytes:
+    """Compresses a response to be stored in the cache database"""
+    cctx, _ = _get_compressors()
+    return cctx.compress(response.encode())
+
+def decode_response(stored: str | bytes) -> str | None:
+    """
+    Decompresses a response stored in the cache database.
+    Entries cached before compression was added are stored as text and returned as is.
+
+    Returns:
+        The response, or None if it can't be decompressed
+        (e.g. it was compressed with a different dictionary).
+    """
+    if isinstance(stored, str):
+        return stored
+    _, dctx = _get_compressors()
+    try:
+        return dctx.decompress(stored).decode()
+    except zstd.ZstdError:
+        return None
+
+def _create_cache_table(cur: Cursor) -> None:
+    """
+    Creates the cache table if it doesn't exist.
+    Prompts are stored alongside their key for debugging only,
+    responses are stored compressed.
+    """
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS cache "
+        "(key BLOB PRIMARY KEY, system_prompt TEXT, content TEXT, response BLOB) "
+        "WITHOUT ROWID"
+    )
+
+def _migrate_cache(con: Connection, cur: Cursor) -> None:
+    """Moves entries from a cache created before entries were keyed by hash"""
+    cur.execute("ALTER TABLE cache RENAME TO old_cache")
+    _create_cache_table(cur)
+    rows = cur.execute("SELECT system_prompt, content, response FROM old_cache").fetchall()
+    entries = [(_key(sp, c), sp, c, r) for sp, c, r in rows]
+    cur.executemany("INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)", entries)
+    cur.execute("DROP TABLE old_cache")
+    con.commit()
+
 def create_db_connection() -> tuple[Connection, Cursor]:
     """ 
     Returns:
         Connection to the cache database
         Cursor to the database
     """
-    con = sqlite3.connect("./llm/cache.db")
+    con = sqlite3.connect("./llm/cache.db", cached_statements=512)
     cur = con.cursor()
-    cur.execute("CREATE TABLE IF NOT EXISTS cache (system_prompt, content, response)")
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    columns = [row[1] for row in cur.execute("PRAGMA table_info(cache)")]
+    if columns and "key" not in columns:
+        _migrate_cache(con, cur)
+    _create_cache_table(cur)
     return con, cur
 
 def query_cache(cur: Cursor, system_prompt: str, content: str) -> str | None:
     """Queries the cache for a response to the given prompt"""
-    params = (system_prompt, content)
-    res = cur.execute("SELECT * FROM cache WHERE system_prompt=? AND content=?", params)
+    params = (_key(system_prompt, content),)
+    res = cur.execute(_SELECT_SQL, params)
     entry = res.fetchone()
     if entry is not None:
-        return entry[2]
+        return decode_response(entry[0])
     return None
 
-def query_llm(system_prompt: str, content: str) -> str:
-    """Gets a response from the LLM for the given prompt"""
-    chat_completion = client.chat.completions.create(
-        messages=[
+def _completion_args(system_prompt: str, content: str) -> dict:
+    """Returns the arguments used to request a chat completion for the given prompt"""
+    return {
+        "messages": [
             {
                 "role": "system",
                 "content": system_prompt,
@@ -42,22 +151,85 @@ def query_llm(system_prompt: str, content: str) -> str:
                 "content": content,
             }
         ],
-        model='meta-llama-3-8b-instruct',
-        max_tokens=1024,
-        temperature=0.7
+        "model": 'meta-llama-3-8b-instruct',
+        "max_tokens": 1024,
+        "temperature": 0.7
+    }
+
+def query_llm(system_prompt: str, content: str) -> str:
+    """Gets a response from the LLM for the given prompt"""
+    chat_completion = client.chat.completions.create(
+        **_completion_args(system_prompt, content)
+    )
+    return chat_completion.choices[0].message.content
+
+async def _query_llm_async(
+    async_client: AsyncOpenAI,
+    system_prompt: str,
+    content: str
+) -> str:
+    """Gets a response from the LLM for the given prompt without blocking"""
+    chat_completion = await async_client.chat.completions.create(
+        **_completion_args(system_prompt, content)
     )
     return chat_completion.choices[0].message.content
 
+def _get_connection() -> tuple[Connection, Cursor]:
+    """Returns this thread's connection to the cache database, opening it if needed"""
+    if not hasattr(_local, "con"):
+        _local.con, _local.cur = create_db_connection()
+    return _local.con, _local.cur
+
+def _remember(key: bytes, response: str) -> None:
+    """Stores a response in memory, evicting the least recently used one if full"""
+    with _memo_lock:
+        _memo[key] = response
+        _memo.move_to_end(key)
+        if len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+def _get_cached(system_prompt: str, content: str) -> str | None:
+    """Gets a cached response, checking memory before the cache database"""
+    key = _key(system_prompt, content)
+    with _memo_lock:
+        response = _memo.get(key)
+        if response is not None:
+            _memo.move_to_end(key)
+            return response
+    _, cur = _get_connection()
+    response = query_cache(cur, system_prompt, content)
+    if response is not None:
+        _remember(key, response)
+    return response
+
+def _put_cached_many(entries: list[tuple[str, str, str]]) -> None:
+    """
+    Stores responses in memory and in the cache database (in a single transaction).
+
+    Args:
+        entries: A list of (system prompt, content, response) tuples.
+    """
+    keys = [_key(sp, c) for sp, c, _ in entries]
+    rows = [
+        (key, sp, c, encode_response(response))
+        for key, (sp, c, response) in zip(keys, entries)
+    ]
+    con, cur = _get_connection()
+    cur.executemany(_INSERT_SQL, rows)
+    con.commit()
+    for key, (_, _, response) in zip(keys, entries):
+        _remember(key, response)
+
+def _put_cached(system_prompt: str, content: str, response: str) -> None:
+    """Stores a response in memory and in the cache database"""
+    _put_cached_many([(system_prompt, content, response)])
+
 def generate_response(system_prompt: str, content: str) -> str:
     """Generates a response for the given prompt"""
-    con, cur = create_db_connection()
-    response = query_cache(cur, system_prompt, content)
+    response = _get_cached(system_prompt, content)
     if response is None:
         response = query_llm(system_prompt, content)
-        data = (system_prompt, content, response)
-        cur.execute("INSERT INTO cache VALUES (?, ?, ?)", data)
-        con.commit()
-    con.close()
+        _put_cached(system_prompt, content, response)
     return response
 
 def drop_cache(system_prompt: str, content: str) -> None:
@@ -65,24 +237,112 @@ def drop_cache(system_prompt: str, content: str) -> None:
     Drops the given entry from the cache,
     so that it can be re-generated on the next call.
     """
-    con, cur = create_db_connection()
-    params = (system_prompt, content)
-    cur.execute("DELETE FROM cache WHERE system_prompt=? AND content=?", params)
+    key = _key(system_prompt, content)
+    con, cur = _get_connection()
+    cur.execute(_DELETE_SQL, (key,))
     con.commit()
-    con.close()
+    with _memo_lock:
+        _memo.pop(key, None)
 
-def generate_prompt(inputs: list, prompt_file: str) -> str:
+async def _generate_response_async(
+    async_client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    system_prompt: str,
+    content: str,
+    in_flight: dict[bytes, asyncio.Future],
+    new_entries: list[tuple[str, str, str]]
+) -> str:
     """
-    Fills in the chosen prompt template with the provided inputs.
+    Generates a response for the given prompt, only waiting on the LLM for cache misses.
+    Prompts already sent to the LLM in this batch (in_flight) wait for the same response
+    instead of sending a duplicate request.
+    Responses from the LLM are added to new_entries, to be cached once the batch is done
+    (or has failed).
+    """
+    key = _key(system_prompt, content)
+    if key in in_flight:
+        return await in_flight[key]
+    response = _get_cached(system_prompt, content)
+    if response is None:
+        future = asyncio.get_running_loop().create_future()
+        in_flight[key] = future
+        try:
+            async with semaphore:
+                response = await _query_llm_async(async_client, system_prompt, content)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(response)
+        new_entries.append((system_prompt, content, response))
+    return response
 
-    Code + template format partially taken from:
-    https://github.com/joonspk-research/generative_agents/
+def generate_responses(prompts: list[tuple[str, str]]) -> list[str]:
+    """
+    Generates responses for many prompts at once.
+    Cache misses are sent to the LLM concurrently, with duplicate prompts only sent once.
+
+    Args:
+        prompts: A list of (system prompt, content) pairs.
+
+    Returns:
+        The responses, in the same order as the prompts.
+    """
+    new_entries = []
+
+    async def gather_responses() -> list[str]:
+        in_flight = {}
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        async_client = AsyncOpenAI(
+            base_url=client.base_url,
+            api_key=client.api_key,
+            http_client=httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        )
+        async with async_client:
+            tasks = [
+                asyncio.ensure_future(_generate_response_async(
+                    async_client, semaphore, system_prompt, content, in_flight, new_entries
+                ))
+                for system_prompt, content in prompts
+            ]
+            try:
+                return await asyncio.gather(*tasks)
+            finally:
+                # If a request failed, stop the rest before the client is closed
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                for future in in_flight.values():
+                    if not future.done():
+                        future.cancel()
+                    elif not future.cancelled():
+                        # Retrieve failures nothing else waited on, so they aren't reported
+                        future.exception()
+
+    try:
+        return asyncio.run(gather_responses())
+    finally:
+        # Responses already generated are kept, even if another request in the batch failed
+        _put_cached_many(new_entries)
+
+@lru_cache(maxsize=32)
+def _load_template(prompt_file: str) -> str:
+    """
+    Loads the chosen prompt template, without its comment header.
+    Input placeholders are rewritten as format fields (e.g. <INPUT 0> becomes {0}).
     """
     path = os.path.join("./prompt_templates", prompt_file + ".txt")
     with open(path, "r", encoding="utf-8") as f:
         prompt = f.read()
-    for idx, input_val in enumerate(inputs):
-        prompt = prompt.replace(f"<INPUT {idx}>", str(input_val))
     if "<END COMMENT>" in prompt:
         prompt = prompt.split("<END COMMENT>")[1]
-    return prompt.strip()
+    prompt = prompt.replace("{", "{{").replace("}", "}}")
+    return _INPUT_PATTERN.sub(r"{\1}", prompt)
+
+def generate_prompt(inputs: list, prompt_file: str) -> str:
+    """
+    Fills in the chosen prompt template with the provided inputs.
+
+    Code + template format partially taken from:
+    https://github.com/joonspk-research/generative_agents/
+    """
+    return _load_template(prompt_file).format(*inputs).strip()
@@ -0,0 +1,69 @@
+"""
+Trains a zstd dictionary on the responses in the cache,
+which makes the compressed responses much smaller.
+Existing entries are re-compressed with the new dictionary.
+
+Run from the root of the project with:
+python -m llm.train_dict
+"""
+import os
+import random
+import zstandard as zstd
+from llm import llm
+
+# Number of responses the dictionary is trained on
+N_SAMPLES = 1000
+DICT_SIZE = 16 * 1024
+
+def train_dict() -> None:
+    """Trains a new dictionary on the cached responses and re-compresses the cache with it"""
+    con, cur = llm.create_db_connection()
+    rows = cur.execute("SELECT key, response FROM cache").fetchall()
+    # Decode with the old dictionary before it's replaced
+    entries = []
+    undecodable = []
+    for key, stored in rows:
+        response = llm.decode_response(stored)
+        if response is None:
+            undecodable.append((key,))
+        else:
+            entries.append((key, response))
+    samples = [
+        response.encode()
+        for _, response in random.sample(entries, min(N_SAMPLES, len(entries)))
+    ]
+    try:
+        dict_data = zstd.train_dictionary(DICT_SIZE, samples)
+    except zstd.ZstdError:
+        print(f"Not enough responses to train a dictionary ({len(samples)} cached)")
+        return
+
+    # The new dictionary only replaces the old one once the cache has been re-compressed,
+    # so an interrupted run leaves the cache readable
+    temp_path = f"{llm.DICT_PATH}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(dict_data.as_bytes())
+    cctx = zstd.ZstdCompressor(level=llm.COMPRESSION_LEVEL, dict_data=dict_data)
+    try:
+        cur.executemany(
+            "UPDATE cache SET response=? WHERE key=?",
+            [(cctx.compress(response.encode()), key) for key, response in entries]
+        )
+        # Rows that can't be decoded with the old dictionary are useless, so are removed
+        cur.executemany("DELETE FROM cache WHERE key=?", undecodable)
+        con.commit()
+    except BaseException:
+        con.rollback()
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, llm.DICT_PATH)
+    cur.execute("VACUUM")
+
+    size = os.path.getsize(llm.DICT_PATH)
+    print(
+        f"Trained a {size} byte dictionary, re-compressed {len(entries)} responses "
+        f"and removed {len(undecodable)} undecodable responses"
+    )
+
+if __name__ == "__main__":
+    train_dict()
@@ -2,14 +2,14 @@
 Unless otherwise stated, all code in this file was NOT implemented by George Taylor.
 The original code comes from the Mesa-Geo project: https://github.com/projectmesa/mesa-geo
 
-The code was modified to add an on_click callback to markers.
+The code was modified to add an on_click callback to markers,
+and to accept read-only portrayals.
 
 At the end of this file, a small amount of code has been implemented by George Taylor.
 Where this is the case has been made clear with comments.
 These comments can be found using Ctrl + F and searching for 'George Taylor'.
 """
 
-import dataclasses
 import warnings
 from dataclasses import dataclass
 from functools import partial
@@ -251,8 +251,9 @@ class MapModule:
         """
 
         if "marker_type" not in properties:  # make circle default marker type
-            properties["marker_type"] = "Circle"
-            properties["radius"] = 5
+            # The following line was implemented by George Taylor
+            # (copied here, as the properties may be a shared read-only portrayal)
+            properties = {**properties, "marker_type": "Circle", "radius": 5}
 
         marker = properties["marker_type"]
         if marker == "Circle":
@@ -283,17 +284,24 @@ class MapModule:
     def _render_agents(self, model):
         feature_collection = {"type": "FeatureCollection", "features": []}
         point_markers = []
-        agent_portrayal = {}
+        # The following lines were implemented by George Taylor
+        # (polygon styles must be plain dicts to be sent to the frontend, so each
+        # shared portrayal is converted once per render, indexed by id - the portrayal
+        # is kept alongside so its id can't be reused during the render)
+        styles = {}
         for agent in model.space.agents:
             transformed_geometry = agent.get_transformed_geometry(
                 model.space.transformer
             )
 
             if self.portrayal_method:
+                # The following lines were implemented by George Taylor
+                # (portrayals can be shared and read-only, so they're only copied when
+                # they have a description to remove - otherwise they're used as they are)
                 properties = self.portrayal_method(agent)
-                agent_portrayal = LeafletViz(
-                    popupProperties=properties.pop("description", None)
-                )
+                description = properties.get("description")
+                if description is not None:
+                    properties = {k: v for k, v in properties.items() if k != "description"}
                 if isinstance(agent.geometry, Point):
                     location = mapping(transformed_geometry)
                     # for some reason points are reversed
@@ -303,11 +311,17 @@ class MapModule:
                     marker.on_click(partial(click_callback, model=model, agent=agent))
                     point_markers.append(marker)
                 else:
-                    agent_portrayal.style = properties
-                    agent_portrayal = dataclasses.asdict(
-                        agent_portrayal,
-                        dict_factory=lambda x: {k: v for (k, v) in x if v is not None},
-                    )
+                    # The following lines were implemented by George Taylor
+                    # (replaces building a LeafletViz and copying it with dataclasses.asdict)
+                    if isinstance(properties, dict):
+                        style = properties
+                    else:
+                        if id(properties) not in styles:
+                            styles[id(properties)] = (properties, dict(properties))
+                        style = styles[id(properties)][1]
+                    agent_portrayal = {"style": style}
+                    if description is not None:
+                        agent_portrayal["popupProperties"] = description
 
                     feature_collection["features"].append(
                         {
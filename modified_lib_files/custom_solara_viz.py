@@ -2,10 +2,12 @@
 Unless otherwise stated, all code in this file was NOT implemented by George Taylor.
 The original code comes from the Mesa project: https://github.com/projectmesa/mesa
 
-This file was edited to change the grid in the visualisation to not be draggable.
+This file was edited to change the grid in the visualisation to not be draggable,
+and to batch the updates made while stepping the model into a single re-render.
 
-A single line has been edited by George Taylor.
-This line has been made marked with a comment on line 199.
+A small number of lines have been edited by George Taylor.
+These lines have been marked with comments,
+which can be found by searching for 'George Taylor'.
 
 The original file continues here:
 
@@ -231,6 +233,8 @@ def ModelController(
     if model_parameters is None:
         model_parameters = {}
     model_parameters = solara.use_reactive(model_parameters)
+    # The following line was implemented by George Taylor
+    render_context = reacton.core.get_render_context()
 
     async def step():
         while playing.value and running.value:
@@ -244,12 +248,15 @@ def ModelController(
     @function_logger(__name__)
     def do_step():
         """Advance the model by the number of steps specified by the render_interval slider."""
-        for _ in range(render_interval.value):
-            model.value.step()
+        # The following line was implemented by George Taylor
+        # Hold back re-renders until the step (and all state changes it causes) is done
+        with render_context:
+            for _ in range(render_interval.value):
+                model.value.step()
 
-        running.value = model.value.running
+            running.value = model.value.running
 
-        force_update()
+            force_update()
 
     @function_logger(__name__)
     def do_reset():
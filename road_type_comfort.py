@@ -7,13 +7,17 @@ can't import from llm properly :)))))
 """
 import os
 import json
-from llm.llm import generate_prompt, generate_response
+from functools import lru_cache
+import numpy as np
+from llm.llm import generate_prompt, generate_responses
 from transport_model.routes import RoadType
 
+@lru_cache
 def get_system_prompts(path: str) -> dict[str, str]:
     """
     Returns a dictionary indexed by name of system prompts
     for all agents in the given scenario.
+    The result is cached, so it shouldn't be modified.
     """
     agent_file = os.path.join(path, "agents.json")
     with open(agent_file, encoding="utf-8") as f:
@@ -34,28 +38,63 @@ def get_system_prompts(path: str) -> dict[str, str]:
 
     return system_prompts
 
+def _comfort_prompt(name: str, road_type: RoadType) -> str:
+    """Creates the comfort prompt for the named agent and the given road."""
+    inputs = [
+        name,
+        road_type.highway,
+        road_type.maxspeed,
+        road_type.info
+    ]
+    return generate_prompt(inputs, "cyclist_comfort")
+
+def compute_comfort_matrix(
+        road_types: list[RoadType],
+        agent_prompts: dict[str, str]
+    ) -> np.ndarray:
+    """
+    Gets the mean comfort value among all agents for each of the given roads.
+    All road/agent combinations are sent to the LLM as a single batch.
+
+    Args:
+        road_types: The roads to get comfort values for.
+        agent_prompts: The system prompt for each agent, indexed by name.
+
+    Returns:
+        An array with the mean comfort value for each road, in the same order as road_types.
+    """
+    prompts = [
+        (system_prompt, _comfort_prompt(name, road_type))
+        for road_type in road_types
+        for name, system_prompt in agent_prompts.items()
+    ]
+    responses = generate_responses(prompts)
+    comfort_values = np.fromiter(
+        (int(response) for response in responses),
+        dtype=np.int8,
+        count=len(responses)
+    ).reshape(len(road_types), len(agent_prompts))
+    return comfort_values.mean(axis=1)
+
 def get_mean_comfort(road_type: RoadType, agent_prompts: dict[str, str]) -> float:
     """Gets the mean comfort value among all agents for the given road."""
-    comfort_values = []
-    for name, system_prompt in agent_prompts.items():
-        inputs = [
-            name,
-            road_type.highway,
-            road_type.maxspeed,
-            road_type.info
-        ]
-        prompt = generate_prompt(inputs, "cyclist_comfort")
-        val = int(generate_response(system_prompt, prompt))
-        comfort_values.append(val)
-    return sum(comfort_values) / len(comfort_values)
+    return float(compute_comfort_matrix([road_type], agent_prompts)[0])
 
 
 if __name__ == "__main__":
     scenario_path = "./scenarios/westerham"
-    road = RoadType(
-        highway = "trunk",
-        maxspeed = "40 mph",
-        info = "n/a"
-    )
+    roads = [
+        RoadType(
+            highway = "trunk",
+            maxspeed = "40 mph",
+            info = "n/a"
+        ),
+        RoadType(
+            highway = "residential",
+            maxspeed = "20 mph",
+            info = "n/a"
+        )
+    ]
     prompts = get_system_prompts(scenario_path)
-    print(get_mean_comfort(road, prompts))
+    for road, mean_comfort in zip(roads, compute_comfort_matrix(roads, prompts)):
+        print(f"{road.highway} ({road.maxspeed}): {mean_comfort}")
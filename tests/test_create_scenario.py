@@ -0,0 +1,29 @@
+"""Tests for sampling random points in scenario areas"""
+import random
+from shapely import MultiPolygon, Polygon, box
+from utils.create_scenario import get_random_points, triangulate_area
+
+def test_random_points_in_multipolygon():
+    random.seed(0)
+    area = MultiPolygon([box(0, 0, 1, 1), box(2, 0, 3, 1)])
+    points = get_random_points(area, 200)
+    assert len(points) == 200
+    assert all(area.covers(point) for point in points)
+    # Both parts of the area should be sampled from
+    assert any(point.x < 1 for point in points)
+    assert any(point.x > 2 for point in points)
+
+def test_random_points_in_concave_polygon():
+    random.seed(0)
+    area = Polygon([(0, 0), (4, 0), (4, 1), (1, 1), (1, 4), (0, 4)])
+    _, _, cumulative_areas = triangulate_area(area)
+    assert abs(cumulative_areas[-1] - area.area) < 1e-9
+    points = get_random_points(area, 200)
+    assert all(area.covers(point) for point in points)
+
+def test_random_points_in_degenerate_area():
+    area = Polygon([(0, 0), (1, 1), (2, 2)])
+    assert triangulate_area(area)[0] == []
+    points = get_random_points(area, 3)
+    assert len(points) == 3
+    assert all(point.equals(area.representative_point()) for point in points)
@@ -36,8 +36,9 @@ class MemoryEntry:
         Args:
             new_time    Time (in mins) to update the average with.
         """
-        self.travel_time = ((self.travel_time * self.count) + new_time) / (self.count + 1)
+        # Incremental (Welford) form of the mean, which avoids rebuilding the total
         self.count += 1
+        self.travel_time += (new_time - self.travel_time) / self.count
 
 class ActiveMemoryEntry(MemoryEntry):
     """
@@ -59,7 +60,7 @@ class ActiveMemoryEntry(MemoryEntry):
             new_time: Time (in mins) to update the average with.
             comfort: Comfort value to update the average with.
         """
-        self.comfort = ((self.comfort * self.count) + new_comfort) / (self.count + 1)
+        self.comfort += (new_comfort - self.comfort) / (self.count + 1)
         super().update(new_time)
 
 class TravelMemory:
@@ -70,11 +71,11 @@ class TravelMemory:
     route_memory        Stores memories of previous routes.
                         Uses the form Route : entry
     comfort_memory      Caches comfort values generated for the given road type.
-                        Uses the form RoadType: {mode: comfort}
+                        Uses the form (RoadType, mode): comfort
     justifications      Stores justifications for mode choices.
     """
     route_memory: dict[Route, MemoryEntry]
-    comfort_memory: dict[RoadType, dict[str, int]]
+    comfort_memory: dict[tuple[RoadType, str], int]
     justifications: list[ModeChoice]
 
     def __init__(self) -> None:
@@ -108,9 +109,8 @@ class TravelMemory:
             The entry for the specified mode and path
             (returns None if it doesn't exist).
         """
-        if route not in self.route_memory:
-            return None
-        return self.route_memory[route]
+        # Single lookup, as hashing a route hashes its whole path
+        return self.route_memory.get(route)
 
     def store_route(
         self,
@@ -153,9 +153,7 @@ class TravelMemory:
             mode: The transport mode.
             comfort: The generated comfort value.
         """
-        if road not in self.comfort_memory:
-            self.comfort_memory[road] = {}
-        self.comfort_memory[road][mode] = comfort
+        self.comfort_memory[(road, mode)] = comfort
 
     def get_comfort(self, road: RoadType, mode: str) -> int | None:
         """
@@ -167,9 +165,7 @@ class TravelMemory:
             The stored comfort value for the given road type and mode,
             or None if it doesn't exist in memory.
         """
-        if road not in self.comfort_memory or mode not in self.comfort_memory[road]:
-            return None
-        return self.comfort_memory[road][mode]
+        return self.comfort_memory.get((road, mode))
 
     def store_mode_choice(self, choice: ModeChoice) -> None:
         """
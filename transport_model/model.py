@@ -1,6 +1,7 @@
 """A model with people who go places"""
 import json
 import os
+import pickle
 from functools import partial
 from time import localtime, strftime
 import mesa
@@ -9,18 +10,17 @@ import geopandas
 import osmnx as ox
 from geopandas.geodataframe import GeoDataFrame
 from networkx import MultiDiGraph
-from .time import Time
+from .time import Time, DAY_START
 from .geo_agents import NetworkLink, Area, ResidentialArea, RetailArea, IndustrialArea
 from .person import Person, PersonAgent
 from .network import TransportNetwork, DriveNetwork, WalkNetwork, BikeNetwork
 
+# Networks are pickled here after being loaded from GraphML, which is much slower to parse
+NETWORK_CACHE_DIRECTORY = "./cache/networks"
+
 def get_num_agents_by_mode(model: mesa.Model, mode: str) -> int:
     """Returns the number of agents currently travelling by the given mode"""
-    agents = [
-        agent for agent in model.agents_by_type[PersonAgent]
-        if agent.get_current_mode() == mode
-    ]
-    return len(agents)
+    return model.num_travelling_by_mode[mode]
 
 class TransportModel(mesa.Model):
     """The core model class"""
@@ -29,11 +29,15 @@ class TransportModel(mesa.Model):
     output_path: str
     space: mg.GeoSpace
     locations: dict
+    location_coords: dict[str, tuple[float, float]]
+    location_nodes: dict[str, dict[str, int]]
     drive_network: DriveNetwork
     walk_network: WalkNetwork
     bike_network: BikeNetwork
+    networks: dict[str, TransportNetwork]
     global_info: str
     selected_agent: PersonAgent
+    num_travelling_by_mode: dict[str, int]
     day: int
     time: Time
     time_step: int
@@ -74,7 +78,7 @@ class TransportModel(mesa.Model):
         self.scenario_path = os.path.join("./scenarios", scenario)
         self.output_path = os.path.join("./output", scenario)
         self.day = 1
-        self.time = Time(4, 0)
+        self.time = DAY_START
         self.time_step = time_step
         self.default_speed_limit = default_speed_limit
         self.car_speed_factor = car_speed_factor
@@ -82,6 +86,8 @@ class TransportModel(mesa.Model):
         self.driving_extra_time = driving_extra_time
         self.cycling_extra_time = cycling_extra_time
 
+        # Kept up to date by the agents as they set off and arrive
+        self.num_travelling_by_mode = {"drive": 0, "walk": 0, "bike": 0}
         self.space = mg.GeoSpace(crs=self.CRS, warn_crs_conversion=False)
 
         self.drive_network = DriveNetwork(
@@ -91,10 +97,16 @@ class TransportModel(mesa.Model):
         )
         self.walk_network = WalkNetwork(self._get_network("walk"))
         self.bike_network = BikeNetwork(self._get_network("bike"))
+        self.networks = {
+            "drive": self.drive_network,
+            "walk": self.walk_network,
+            "bike": self.bike_network
+        }
 
         self._create_link_agents(self.drive_network)
 
         self._load_locations()
+        self._snap_locations()
         self._load_people()
         self._load_areas()
         self._load_info()
@@ -125,14 +137,48 @@ class TransportModel(mesa.Model):
         )
 
     def _get_network(self, network_type: str) -> MultiDiGraph:
-        """Loads network from file in the scenario"""
+        """
+        Loads network from file in the scenario.
+        The parsed network is cached, and only reloaded if the GraphML file has changed since.
+        """
         network_path = os.path.join(self.scenario_path, f"network_{network_type}.graphml")
-        return ox.io.load_graphml(network_path)
+        cache_dir = os.path.join(NETWORK_CACHE_DIRECTORY, os.path.basename(self.scenario_path))
+        cache_path = os.path.join(cache_dir, f"network_{network_type}.pkl")
+        if (
+            os.path.exists(cache_path)
+            and os.path.getmtime(cache_path) >= os.path.getmtime(network_path)
+        ):
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+
+        graph = ox.io.load_graphml(network_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary file first, as other runs may be loading the network at the same time
+        temp_path = f"{cache_path}.{os.getpid()}"
+        with open(temp_path, "wb") as f:
+            pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+        return graph
+
+    def _create_agents(self, agent_class: type[mg.GeoAgent], gdf: GeoDataFrame) -> list:
+        """
+        Creates an agent for each row of the GeoDataFrame, with the other columns as attributes.
+        Same as mg.AgentCreator.from_GeoDataFrame, but reads whole columns at once
+        instead of building a pandas Series for every row.
+        """
+        columns = [col for col in gdf.columns if col != gdf.geometry.name]
+        values = [gdf[col].tolist() for col in columns]
+        agents = []
+        for geometry, row in zip(gdf.geometry, zip(*values)):
+            agent = agent_class(self, geometry, gdf.crs)
+            for col, value in zip(columns, row):
+                setattr(agent, col, value)
+            agents.append(agent)
+        return agents
 
     def _create_link_agents(self, network: TransportNetwork) -> None:
         """Creates network link agents from provided network"""
-        link_creator = mg.AgentCreator(NetworkLink, model=self)
-        links = link_creator.from_GeoDataFrame(network.get_edges_as_gdf())
+        links = self._create_agents(NetworkLink, network.get_edges_as_gdf())
         self.space.add_agents(links)
 
     def _load_locations(self) -> None:
@@ -140,6 +186,22 @@ class TransportModel(mesa.Model):
         locations_path = os.path.join(self.scenario_path, "locations.json")
         with open(locations_path, encoding="utf-8") as f:
             self.locations = json.load(f)
+        self.location_coords = {
+            name: (info["long"], info["lat"]) for name, info in self.locations.items()
+        }
+
+    def _snap_locations(self) -> None:
+        """
+        Finds the nearest node to every location in each network (in one query per network),
+        and the shortest paths from those nodes in advance.
+        """
+        location_coords = [self.get_location_coords(name) for name in self.locations]
+        self.location_nodes = {}
+        for mode in ("drive", "walk", "bike"):
+            network = self.get_network(mode)
+            nodes = network.get_nearest_nodes(location_coords)
+            self.location_nodes[mode] = dict(zip(self.locations, nodes))
+            network.precompute_paths(nodes)
 
     def _load_people(self) -> None:
         """Loads person agents from file in the scenario"""
@@ -147,20 +209,21 @@ class TransportModel(mesa.Model):
         with open(agents_path, encoding="utf-8") as f:
             agents_json = json.load(f)
 
-        for info_dict in agents_json:
-            new_person = Person(info_dict)
-            new_agent = PersonAgent(
+        # Added to the space together, so its spatial index is only updated once
+        agents = [
+            PersonAgent(
                 model = self,
                 crs = self.CRS,
-                person = new_person
+                person = Person(info_dict)
             )
-            self.space.add_agents(new_agent)
+            for info_dict in agents_json
+        ]
+        self.space.add_agents(agents)
 
     def _load_area_type(self, areas: GeoDataFrame, area_class: type[Area], landuse: str) -> None:
         """"Creates agents for the specicfied area class and landuse"""
         areas_of_type = areas.loc[areas["landuse"] == landuse]
-        area_creator = mg.AgentCreator(area_class, model=self)
-        agents = area_creator.from_GeoDataFrame(areas_of_type)
+        agents = self._create_agents(area_class, areas_of_type)
         self.space.add_agents(agents)
 
     def _load_areas(self) -> None:
@@ -188,39 +251,47 @@ class TransportModel(mesa.Model):
     def _get_num_files(self, path: str) -> int:
         """Gets the number of files in the provided directory"""
         try:
-            files = next(os.walk(path))[2]
-        except StopIteration:
-            files = []
-        return len(files)
+            with os.scandir(path) as entries:
+                return sum(1 for entry in entries if entry.is_file())
+        except FileNotFoundError:
+            return 0
 
     def _write_journeys_to_csv(self) -> None:
         """Writes data from the journeys table to disk"""
-        if not os.path.exists(self.output_path):
-            os.makedirs(self.output_path)
+        os.makedirs(self.output_path, exist_ok=True)
         dataframe = self.datacollector.get_table_dataframe("journeys")
         num_files = self._get_num_files(self.output_path)
-        csv_path = os.path.join(self.output_path, f"run {num_files}.csv")
-        dataframe.to_csv(csv_path)
+        # Other runs may be writing to the same folder at the same time,
+        # so only create the file if the name hasn't been taken
+        while True:
+            csv_path = os.path.join(self.output_path, f"run {num_files}.csv")
+            try:
+                with open(csv_path, "x", encoding="utf-8", newline="") as f:
+                    dataframe.to_csv(f)
+                return
+            except FileExistsError:
+                num_files += 1
+
+    @property
+    def num_travelling(self) -> int:
+        """The number of agents currently travelling (by any mode)"""
+        return sum(self.num_travelling_by_mode.values())
 
     def get_location_coords(self, loc_name: str) -> tuple[float, float]:
         """Returns the coordinates of the specified location"""
-        long = self.locations[loc_name]["long"]
-        lat = self.locations[loc_name]["lat"]
-        return long, lat
+        return self.location_coords[loc_name]
+
+    def get_location_node(self, loc_name: str, mode: str) -> int:
+        """Returns the nearest node to the specified location in the network for the mode"""
+        return self.location_nodes[mode][loc_name]
 
     def is_location(self, location: str) -> bool:
         """Checks if the provided location is in the environment"""
-        return location in self.locations.keys()
+        return location in self.locations
 
     def get_network(self, mode: str) -> TransportNetwork:
         """Returns the network for the specified mode"""
-        if mode == "drive":
-            return self.drive_network
-        if mode == "walk":
-            return self.walk_network
-        if mode == "bike":
-            return self.bike_network
-        return None
+        return self.networks.get(mode)
 
     def get_extra_time(self, mode: str) -> float:
         """Gets extra time for the provided mode"""
@@ -231,7 +302,7 @@ class TransportModel(mesa.Model):
         return 0
 
     def step(self) -> None:
-        if self.time.time_to(Time(4, 0)) < self.time_step:
+        if self.time.time_to(DAY_START) < self.time_step:
             print(f"{strftime('%H:%M:%S', localtime())} - it's 04:00 on day {self.day}")
             if self.day == self.n_days + 1:
                 # simulation has finished - record journey data
@@ -2,17 +2,21 @@
 from typing import override
 from dataclasses import dataclass
 from collections.abc import Iterator
+import numpy as np
 import osmnx as ox
 import networkx as nx
-from sklearn.neighbors import KDTree
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import KDTree
 from geopandas import GeoDataFrame
 from shapely import LineString
 from .routes import Route, RouteProgress
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Edge:
     """
     Represents an edge in the graph.
+    One is created for every moving agent each step, so it has no __dict__.
     
     u       ID of the starting node of this edge.
     v       ID of the ending node of this edge.
@@ -20,50 +24,79 @@ class Edge:
     u: int
     v: int
 
+def advance_along_path(cumulative_times: np.ndarray, time: float) -> tuple[int, float] | None:
+    """
+    Finds how far along a path we get in the given time.
+
+    Args:
+        cumulative_times: The time taken to reach the end of each edge of the path
+                          (in minutes), i.e. the cumulative sum of the edge times.
+        time: How many minutes to traverse the path for.
+
+    Returns:
+        Index of the edge we end up on.
+        How far through traversing the edge we are (in minutes).
+        None if the path is completed in the given time.
+    """
+    # First edge we don't finish traversing
+    i = int(np.searchsorted(cumulative_times, time, side="right"))
+    if i == len(cumulative_times):
+        return None
+    time_before_edge = cumulative_times[i - 1] if i > 0 else 0.0
+    return i, float(time - time_before_edge)
+
 class TransportNetwork():
     """
     Represents a transport network
     
-    graph       The graph that represents the transport network.
-    kd_tree     A KDTree initialised with the positions of nodes in the graph.
-                Used to find the nearest node to a given point.
+    graph               The graph that represents the transport network.
+    digraph             The graph without parallel edges (used for routing).
+    kd_tree             A KDTree initialised with the positions of nodes in the graph.
+                        Used to find the nearest node to a given point.
+    node_ids            IDs of the nodes in the graph, in the order used by kd_tree
+                        and shortest_path_trees.
+    node_index          The position of each node in node_ids, indexed by node ID.
+    node_coords         The (x, y) coordinates of each node, indexed by node ID.
+    shortest_path_trees Indexed by source node, for each node in the graph gives the
+                        index of the node before it on the shortest path from the source.
+    path_cache          Paths found so far between pairs of nodes, indexed by (source, target).
+    path_iterators      Iterators that find the next shortest path, indexed by (source, target).
+    edges_gdf           The edges of the graph as a GeoDataFrame (None until first requested).
+    edge_attrs          The info dict of each edge (the first of any parallel edges),
+                        indexed by (u, v).
+    edge_geometries     The geometry of each edge agents have moved along so far,
+                        indexed by (u, v).
     """
     graph: nx.MultiDiGraph
+    digraph: nx.DiGraph
     kd_tree: KDTree
+    node_ids: list[int]
+    node_index: dict[int, int]
+    node_coords: dict[int, tuple[float, float]]
+    shortest_path_trees: dict[int, np.ndarray]
+    path_cache: dict[tuple[int, int], list[list[int]]]
+    path_iterators: dict[tuple[int, int], Iterator[list[int]]]
+    edges_gdf: GeoDataFrame | None
+    edge_attrs: dict[tuple[int, int], dict]
+    edge_geometries: dict[tuple[int, int], LineString]
 
     def __init__(self, graph: nx.MultiDiGraph) -> None:
         self.graph = graph
-        node_positions = [(node[1]["x"], node[1]["y"]) for node in self.graph.nodes.data()]
-        self.kd_tree = KDTree(node_positions)
-
-    def _get_final_edge(
-            self,
-            path: list[int],
-            time: float,
-            speed: float = None
-        ) -> tuple[Edge, float, float]:
-        """
-        Gets the edge we'll end up on after traversing the given path.
-
-        Args:
-            path: The path to traverse.
-            time: How many minutes to traverse the path for.
-            speed: (For walking or cycling), the speed to traverse the path at.
-
-        Returns:
-            Final Edge.
-            Edge traversal time (in minutes).
-            How far through traversing the edge we are (in minutes).
-        """
-        cumulative_time = 0
-        for i in range(len(path) - 1):
-            edge_data = self.edge_info(path[i], path[i + 1])
-            edge_time = self._get_edge_time(edge_data, speed)
-            if cumulative_time + edge_time > time:
-                time_along_edge = time - cumulative_time
-                return Edge(path[i], path[i + 1]), edge_time, time_along_edge
-            cumulative_time += edge_time
-        return None
+        self.digraph = ox.convert.to_digraph(graph)
+        self.node_coords = {node: (attrs["x"], attrs["y"]) for node, attrs in graph.nodes.data()}
+        self.kd_tree = KDTree(list(self.node_coords.values()))
+        self.node_ids = list(self.node_coords)
+        self.node_index = {node: i for i, node in enumerate(self.node_ids)}
+        self.shortest_path_trees = {}
+        self.path_cache = {}
+        self.path_iterators = {}
+        self.edges_gdf = None
+        self.edge_attrs = {
+            (u, v): attrs
+            for u, v, key, attrs in graph.edges(keys=True, data=True)
+            if key == 0
+        }
+        self.edge_geometries = {}
 
     def _create_line(self, edge: Edge) -> LineString:
         """
@@ -86,12 +119,16 @@ class TransportNetwork():
             The edge's geometry if it has set geometry, or a
             straight line between its start and end nodes.
         """
-        edge_data = self.edge_info(edge.u, edge.v)
-
-        if "geometry" in edge_data:
-            return edge_data["geometry"]
-
-        return self._create_line(edge)
+        key = (edge.u, edge.v)
+        geometry = self.edge_geometries.get(key)
+        if geometry is None:
+            edge_data = self.edge_info(edge.u, edge.v)
+            if "geometry" in edge_data:
+                geometry = edge_data["geometry"]
+            else:
+                geometry = self._create_line(edge)
+            self.edge_geometries[key] = geometry
+        return geometry
 
     def _get_point_along_edge(
             self,
@@ -108,10 +145,27 @@ class TransportNetwork():
             An (x, y) coordinate the specified proportion along the edge.
         """
         geometry = self._get_edge_geometry(edge)
-        interpolation_dist =  progress * geometry.length
-        new_point = geometry.interpolate(interpolation_dist)
+        new_point = geometry.interpolate(progress, normalized=True)
         return (new_point.x, new_point.y)
 
+    def get_edge_times(self, path: list[int], speed: float = None) -> np.ndarray:
+        """
+        Args:
+            path: The path to get edge times for.
+            speed: (Only for walking and cycling) the agent's speed.
+
+        Returns:
+            How long it takes to traverse each edge in the path (in minutes).
+        """
+        return np.fromiter(
+            (
+                self._get_edge_time(self.edge_info(path[i], path[i + 1]), speed)
+                for i in range(len(path) - 1)
+            ),
+            dtype=np.float64,
+            count=len(path) - 1
+        )
+
     def get_path_duration(self, path: list[int], speed: float = None) -> float:
         """
         Args:
@@ -121,11 +175,7 @@ class TransportNetwork():
         Returns:
             How long it takes to traverse the given path (in minutes).
         """
-        total_time = 0
-        for i in range(len(path) - 1):
-            edge_info = self.edge_info(path[i], path[i + 1])
-            total_time += self._get_edge_time(edge_info, speed)
-        return total_time
+        return float(self.get_edge_times(path, speed).sum())
 
     def get_path_distance(self, path: list[int]) -> float:
         """
@@ -149,9 +199,20 @@ class TransportNetwork():
         Returns:
             The ID of the nearest node in the graph to the provided coords.
         """
-        node_index = self.kd_tree.query([coords], k=1, return_distance=False)
-        node_id = list(self.graph.nodes)[node_index[0,0]]
-        return node_id
+        _, node_index = self.kd_tree.query(coords)
+        return self.node_ids[node_index]
+
+    def get_nearest_nodes(self, coords: list[tuple[float, float]]) -> list[int]:
+        """
+        Args:
+            coords: A list of coords to search for nodes near.
+
+        Returns:
+            The IDs of the nearest node in the graph to each of the provided coords.
+        """
+        # Queries are split across all cores
+        _, node_indices = self.kd_tree.query(coords, workers=-1)
+        return [self.node_ids[i] for i in node_indices]
 
     def get_node_coords(self, node_id: int) -> tuple[float, float]:
         """
@@ -161,22 +222,24 @@ class TransportNetwork():
         Returns:
             The (x, y) coordinates of the node.
         """
-        return self.graph.nodes[node_id]["x"], self.graph.nodes[node_id]["y"]
+        return self.node_coords[node_id]
 
     def get_edges_as_gdf(self) -> GeoDataFrame:
         """
         Returns:
             A GeoDataFrame with the edges of this network's graph
+            (built on the first call, as the graph doesn't change).
         """
-        gdfs = ox.convert.graph_to_gdfs(self.graph) # tuple w/ format (nodes, edges)
-        return gdfs[1]
+        if self.edges_gdf is None:
+            self.edges_gdf = ox.convert.graph_to_gdfs(self.graph, nodes=False)
+        return self.edges_gdf
 
     def traverse_route(
             self,
             route: Route,
             progress: RouteProgress,
             time_step: int,
-            speed: float = None
+            edge_times: np.ndarray
         ) -> tuple[RouteProgress, tuple[float, float] | None, float]:
         """
         Traverses the provided route.
@@ -185,7 +248,8 @@ class TransportNetwork():
             route: The route to traverse.
             progress: How far through traversing the route the agent is.
             time_step: How much time passes with each model time step (in minutes).
-            speed: (Only for walking and cycling) the speed to traverse the route at.
+            edge_times: The time taken to traverse each edge of the route
+                        (calculated once per route with get_edge_times).
 
         Returns:
             Agent's new progress through the route.
@@ -194,17 +258,21 @@ class TransportNetwork():
             (e.g. if step is 5 mins and agent only needs to move for
             3 mins to finish, return 2)
         """
-        remaining_path = route.from_node(progress.node)
-        path_time = self.get_path_duration(remaining_path, speed)
+        # Single pass over the remaining edges, used for both the duration and final edge
+        cumulative_times = np.cumsum(edge_times[progress.index:])
+        path_time = float(cumulative_times[-1]) if cumulative_times.size else 0.0
         traversal_time = time_step + progress.offset
 
         if traversal_time > path_time:
             # Route completed
             time_left = traversal_time - path_time
-            return RouteProgress(route.path[-1]), None, time_left
+            return RouteProgress(route.path[-1], index=len(route.path) - 1), None, time_left
 
-        edge, edge_time, new_offset = self._get_final_edge(remaining_path, traversal_time, speed)
-        new_progress = RouteProgress(edge.u, new_offset)
+        edges_traversed, new_offset = advance_along_path(cumulative_times, traversal_time)
+        index = progress.index + edges_traversed
+        edge = Edge(route.path[index], route.path[index + 1])
+        edge_time = float(edge_times[index])
+        new_progress = RouteProgress(edge.u, new_offset, index)
 
         edge_progress = new_offset / edge_time
         new_location = self._get_point_along_edge(edge, edge_progress)
@@ -218,7 +286,7 @@ class TransportNetwork():
         Returns:
             The info dict for the provided edge.
         """
-        return self.graph.get_edge_data(edge_u, edge_v)[0]
+        return self.edge_attrs[(edge_u, edge_v)]
 
     def _get_edge_time(self, attrs: dict, speed: float = None) -> float:
         """
@@ -242,12 +310,111 @@ class TransportNetwork():
         """
         raise NotImplementedError("Implemented in subclass")
 
+    def _routing_weight(self, attrs: dict) -> float:
+        """
+        Args:
+            attrs: The info dict of an edge.
+
+        Returns:
+            The weight of the edge used when planning paths.
+        """
+        raise NotImplementedError("Implemented in subclass")
+
+    def precompute_paths(self, sources: list[int]) -> None:
+        """
+        Finds the shortest paths from each of the given nodes to every other node in advance,
+        so that the first path planned from them doesn't need a search.
+
+        Args:
+            sources: The nodes to find shortest paths from.
+        """
+        rows, cols, weights = [], [], []
+        for u, v, attrs in self.digraph.edges(data=True):
+            rows.append(self.node_index[u])
+            cols.append(self.node_index[v])
+            weights.append(self._routing_weight(attrs))
+        n_nodes = len(self.node_ids)
+        adjacency = csr_array((weights, (rows, cols)), shape=(n_nodes, n_nodes))
+
+        sources = list(dict.fromkeys(sources))
+        source_indices = [self.node_index[source] for source in sources]
+        _, predecessors = dijkstra(adjacency, indices=source_indices, return_predecessors=True)
+        for source, tree in zip(sources, predecessors):
+            self.shortest_path_trees[source] = tree
+
+    def _get_precomputed_path(self, source: int, target: int) -> list[int] | None:
+        """
+        Returns:
+            The shortest path from source to target, or None if it hasn't been precomputed
+            (or there isn't one).
+        """
+        tree = self.shortest_path_trees.get(source)
+        if tree is None or source == target:
+            return None
+        path = [target]
+        index = self.node_index[target]
+        while tree[index] >= 0:
+            index = tree[index]
+            path.append(self.node_ids[index])
+        if path[-1] != source:
+            # Target can't be reached
+            return None
+        path.reverse()
+        return path
+
+    def _find_new_path(self, source: int, target: int) -> list[int] | None:
+        """
+        Returns:
+            The next shortest path from source to target that isn't in path_cache,
+            or None if there are no more paths.
+        """
+        key = (source, target)
+        if key not in self.path_iterators:
+            self.path_iterators[key] = self.plan_paths(source, target)
+        # The first path may already have been found from shortest_path_trees
+        for path in self.path_iterators[key]:
+            if path not in self.path_cache[key]:
+                return path
+        return None
+
+    def cached_paths(self, source: int, target: int) -> Iterator[list[int]]:
+        """
+        Same as plan_paths, but paths are only calculated once for each source + target.
+        The network doesn't change during a run, so paths found for one agent
+        can be reused by every other agent.
+
+        Args:
+            source: The start node.
+            target: The end node.
+
+        Returns:
+            an iterator of shortest paths from the source node to the target node.
+        """
+        key = (source, target)
+        if key not in self.path_cache:
+            shortest_path = self._get_precomputed_path(source, target)
+            self.path_cache[key] = [] if shortest_path is None else [shortest_path]
+        found_paths = self.path_cache[key]
+
+        i = 0
+        while True:
+            if i == len(found_paths):
+                # Only find the next path when it's needed
+                new_path = self._find_new_path(source, target)
+                if new_path is None:
+                    return
+                found_paths.append(new_path)
+            yield found_paths[i]
+            i += 1
+
 class DriveNetwork(TransportNetwork):
     """
     Network for driving.
     
     default_limit       The speed limit (in km/h) applied to roads with no defined speed limit.
     speed_factor        Multiplied by speed limit to get the speed a car will travel at.
+
+    The time to drive each edge is stored in the edge's "drive_time" attribute.
     """
     default_limit: int
     speed_factor: float
@@ -260,6 +427,9 @@ class DriveNetwork(TransportNetwork):
     ) -> None:
         self.default_limit = default_limit
         self.speed_factor = speed_factor
+        # Worked out once, rather than parsing speed limits every time an edge is used
+        for _, _, attrs in graph.edges(data=True):
+            attrs["drive_time"] = self._compute_edge_time(attrs)
         super().__init__(graph)
 
     def _get_num_limit(self, limit: str) -> float:
@@ -295,12 +465,28 @@ class DriveNetwork(TransportNetwork):
             return sum(num_limits) / len(limit)
         return self._get_num_limit(limit)
 
-    def _weight_func(self, u: int, v: int, attrs: dict) -> float:
+    def _compute_edge_time(self, attrs: dict) -> float:
         """
-        Wrapper to match expected function signature for weight function.
-        Used for NetworkX shortest path calculations only.
+        Args:
+            attrs: The info dict of an edge.
+
+        Returns:
+            The time taken to drive the edge (in minutes).
+        """
+        speed_limit = self._get_speed_limit(attrs)
+        car_speed = speed_limit * self.speed_factor
+        return ((attrs["length"] / 1000) / car_speed) * 60
+
+    @override
+    def _routing_weight(self, attrs: dict) -> float:
+        """
+        Args:
+            attrs: The info dict of an edge.
+
+        Returns:
+            The time taken to traverse the edge.
         """
-        return self._get_edge_time(attrs)
+        return attrs["drive_time"]
 
     @override
     def _get_edge_time(self, attrs: dict, speed: float = None) -> float:
@@ -312,9 +498,7 @@ class DriveNetwork(TransportNetwork):
         Returns:
             The time taken to traverse the given edge.
         """
-        speed_limit = self._get_speed_limit(attrs)
-        car_speed = speed_limit * self.speed_factor
-        return ((attrs["length"] / 1000) / car_speed) * 60
+        return attrs["drive_time"]
 
     @override
     def plan_paths(self, source: int, target: int) -> Iterator[list[int]]:
@@ -326,13 +510,23 @@ class DriveNetwork(TransportNetwork):
         Returns:
             an iterator of shortest paths from the source node to the target node.
         """
-        digraph = ox.convert.to_digraph(self.graph)
-        paths = nx.shortest_simple_paths(digraph, source, target, weight=self._weight_func)
+        paths = nx.shortest_simple_paths(self.digraph, source, target, weight="drive_time")
         return paths
 
 class ActiveNetwork(TransportNetwork):
     """Network for active travel (walking and cycling)."""
 
+    @override
+    def _routing_weight(self, attrs: dict) -> float:
+        """
+        Args:
+            attrs: The info dict of an edge.
+
+        Returns:
+            The length of the edge.
+        """
+        return attrs["length"]
+
     @override
     def _get_edge_time(self, attrs: dict, speed: float = None) -> float:
         """
@@ -355,8 +549,7 @@ class ActiveNetwork(TransportNetwork):
         Returns:
             an iterator of shortest paths from the source node to the target node.
         """
-        digraph = ox.convert.to_digraph(self.graph)
-        paths = nx.shortest_simple_paths(digraph, source, target, weight="length")
+        paths = nx.shortest_simple_paths(self.digraph, source, target, weight="length")
         return paths
 
 class WalkNetwork(ActiveNetwork):
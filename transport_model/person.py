@@ -2,10 +2,12 @@
 import re
 import mesa
 import mesa_geo as mg
+import numpy as np
 from shapely import Point
 from llm.llm import generate_response, generate_prompt, drop_cache
-from transport_model.time import Time
+from transport_model.time import Time, DAY_START
 from .routes import Trip, Route, RouteProgress, RoadType
+from .network import TransportNetwork
 from .memory import TravelMemory, ModeChoice
 
 class Person:
@@ -21,7 +23,15 @@ class Person:
     owns_bike           Whether this person owns a bicycle.
     daily_plan          This person's plan for today. 
                         List of actions in the format (time, action).
+    _system_prompt      Cached result of generate_system_prompt (None until first generated).
+    _global_info        The global info _system_prompt was generated with. The cache is
+                        regenerated when it's called with different global info. The name,
+                        home and description are assumed not to change after creation.
     """
+    __slots__ = (
+        "name", "home", "description", "walk_speed", "bike_speed",
+        "owns_car", "owns_bike", "daily_plan", "_global_info", "_system_prompt"
+    )
     name: str
     home: str
     description: str
@@ -30,6 +40,8 @@ class Person:
     owns_car: bool
     owns_bike: bool
     daily_plan: list[tuple[Time, str]]
+    _system_prompt: str | None
+    _global_info: str | None
 
     def __init__(
         self,
@@ -43,6 +55,8 @@ class Person:
         self.owns_car = info_dict["owns_car"]
         self.owns_bike = info_dict["owns_bike"]
         self.daily_plan = []
+        self._global_info = None
+        self._system_prompt = None
 
     def _break_down_plan(self, plan: str) -> None:
         """
@@ -70,14 +84,20 @@ class Person:
         self.daily_plan = cleaned_plan
 
     def generate_system_prompt(self, global_info: str) -> str:
-        """Generates the system prompt for this person"""
-        inputs = [
-            self.name,
-            self.home,
-            self.description,
-            global_info
-        ]
-        return generate_prompt(inputs, "system_prompt")
+        """
+        Generates the system prompt for this person.
+        The prompt is only regenerated when the global info changes.
+        """
+        if self._system_prompt is None or global_info != self._global_info:
+            inputs = [
+                self.name,
+                self.home,
+                self.description,
+                global_info
+            ]
+            self._system_prompt = generate_prompt(inputs, "system_prompt")
+            self._global_info = global_info
+        return self._system_prompt
 
     def plan_day(self, global_info: str) -> None:
         """Generates a plan for this agent's day using the LLM"""
@@ -101,18 +121,30 @@ class PersonAgent(mg.GeoAgent):
     trip                This person's next planned trip.
     route               This person's current route (None if not travelling).
     route_progress      Stores how far through the current route this person is.
+    route_network       The network for the mode of the current route.
+    route_edge_times    The time taken for this person to traverse each edge of the current route.
+    route_distance      The length of the current route in metres.
     location            This person's current location (None if travelling).
+    position            The (x, y) coordinates of this person.
     memory              Stores memories of previous journeys.
-    edge_comfort        Comfort values multiplied by edge weight for every edge this agent 
-                        has passed so far in its route. Used to calculate a weighted average.
+    edge_comfort        Comfort value of each edge in the current route (only for walking
+                        and cycling). Filled in as the edges are passed.
+    edge_lengths        Length of each edge in the current route, filled in alongside
+                        edge_comfort. Used to weight the comfort average.
     """
     person: Person
     trip: Trip
     route: Route
     route_progress: RouteProgress
+    route_network: TransportNetwork
+    route_edge_times: np.ndarray
+    route_distance: float
     location: str
+    position: tuple[float, float]
     memory: TravelMemory
-    edge_comfort: list[int]
+    edge_comfort: np.ndarray
+    edge_lengths: np.ndarray
+    _geometry: Point | None
 
     def __init__(
         self,
@@ -130,25 +162,44 @@ class PersonAgent(mg.GeoAgent):
     def __repr__(self) -> str:
         return f"Agent {self.person.name}"
 
+    @property
+    def geometry(self) -> Point:
+        """
+        This agent's geometry, as required by mesa-geo.
+        Only created when it's needed (e.g. by the visualisation),
+        rather than every time the agent moves.
+        """
+        if self._geometry is None:
+            self._geometry = Point(self.position)
+        return self._geometry
+
+    @geometry.setter
+    def geometry(self, geometry: Point) -> None:
+        self._geometry = geometry
+        self.position = (geometry.x, geometry.y)
+
     def _set_position(self, position: tuple[float, float]) -> None:
         """Sets this agent's current position"""
-        self.geometry = Point(position)
+        self.position = position
+        self._geometry = None
 
     def _clear_travel_info(self) -> None:
         """Clears information stored when travelling"""
         self.trip = None
         self.route = None
         self.route_progress = None
-        self.edge_comfort = []
+        self.route_network = None
+        self.route_edge_times = None
+        self.route_distance = None
+        self.edge_comfort = None
+        self.edge_lengths = None
 
     def _mode_possible_routes(self, origin: str, destination: str, mode: str) -> list[Route]:
         """Returns a list of all routes we've taken before + 1 new one for the given mode"""
         network = self.model.get_network(mode)
-        origin_coords = self.model.get_location_coords(origin)
-        origin_node = network.get_nearest_node(origin_coords)
-        destination_coords = self.model.get_location_coords(destination)
-        destination_node = network.get_nearest_node(destination_coords)
-        paths = network.plan_paths(origin_node, destination_node)
+        origin_node = self.model.get_location_node(origin, mode)
+        destination_node = self.model.get_location_node(destination, mode)
+        paths = network.cached_paths(origin_node, destination_node)
         routes = []
         for path in paths:
             new_route = Route(mode, path)
@@ -240,9 +291,21 @@ class PersonAgent(mg.GeoAgent):
         """Plan a route for the planned trip."""
         self.route = self._choose_a_route(self.trip.origin, self.trip.destination)
         self.route_progress = RouteProgress(self.route.path[0])
+        self.model.num_travelling_by_mode[self.route.mode] += 1
 
         # Move the agent to the start node
         network = self.model.get_network(self.route.mode)
+        # Stored so that moving along the route doesn't need to look it up by mode
+        self.route_network = network
+        self.route_edge_times = network.get_edge_times(
+            self.route.path,
+            self._get_speed(self.route.mode)
+        )
+        self.route_distance = network.get_path_distance(self.route.path)
+        if self.route.mode != "drive":
+            num_edges = len(self.route.path) - 1
+            self.edge_comfort = np.empty(num_edges)
+            self.edge_lengths = np.empty(num_edges)
         start_coords = network.get_node_coords(self.route.path[0])
         self._set_position(start_coords)
 
@@ -310,31 +373,30 @@ class PersonAgent(mg.GeoAgent):
         response = generate_response(system_prompt, prompt)
         return int(response)
 
-    def _remember_comfort(self, start_node: int) -> None:
+    def _remember_comfort(self, start_index: int) -> None:
         """
         Generates and stores comfort values for the edges we just traversed.
 
         Args:
-            start_node        The start node of the edge the agent started this time step on.
+            start_index       The index in the path of the edge the agent started this time step on.
         """
         if self.route.mode == "drive":
             # Comfort for driving assumed to be invariable.
             return
 
-        network = self.model.get_network(self.route.mode)
-        # Get the nodes of the edges we've traversed
-        nodes = self.route.between_nodes(start_node, self.route_progress.node)
+        network = self.route_network
+        path = self.route.path
 
-        # For every edge, store a comfort value
-        for i in range(len(nodes) - 1):
-            edge_info = network.edge_info(nodes[i], nodes[i + 1])
+        # For every edge we've traversed, store a comfort value
+        for i in range(start_index, self.route_progress.index):
+            edge_info = network.edge_info(path[i], path[i + 1])
             road = self._get_road_type(edge_info)
             comfort = self.memory.get_comfort(road, self.route.mode)
             if comfort is None:
                 comfort = self._get_comfort(road, self.route.mode)
                 self.memory.store_comfort(road, self.route.mode, comfort)
-            length = edge_info["length"]
-            self.edge_comfort.append(comfort * length)
+            self.edge_comfort[i] = comfort
+            self.edge_lengths[i] = edge_info["length"]
 
     def _get_start_day(self, start_time: Time, end_time: Time, end_day: int) -> int:
         """
@@ -366,8 +428,6 @@ class PersonAgent(mg.GeoAgent):
         end_time = start_time.n_mins_from_now(trip_time)
         end_day = self.model.day
         start_day = self._get_start_day(start_time, end_time, end_day)
-        network = self.model.get_network(self.route.mode)
-        distance = network.get_path_distance(self.route.path)
         return {
             "agent_name": self.person.name,
             "origin": self.trip.origin,
@@ -380,7 +440,7 @@ class PersonAgent(mg.GeoAgent):
             "end_minute": end_time.minute,
             "travel_time": trip_time,
             "mode": self.route.mode,
-            "distance": distance
+            "distance": self.route_distance
         }
 
     def _record_journey(self, mins_left: float) -> None:
@@ -403,37 +463,34 @@ class PersonAgent(mg.GeoAgent):
         if self.route.mode == "drive":
             # Comfort is not considered for driving.
             return None
-        if not self.edge_comfort:
+        if self.edge_comfort.size == 0:
             # Sometimes the agent hasn't traversed any edges - give max comfort by default.
             # This occurs when two locations are very close together.
             return 10
 
-        network = self.model.get_network(self.route.mode)
-        total_length = network.get_path_distance(self.route.path)
-
-        return sum(self.edge_comfort) / total_length
+        return float(np.dot(self.edge_comfort, self.edge_lengths)) / self.route_distance
 
     def _follow_route(self) -> None:
         """Move along the planned route"""
-        network = self.model.get_network(self.route.mode)
-        speed = self._get_speed(self.route.mode)
+        network = self.route_network
 
-        start_node = self.route_progress.node
+        start_index = self.route_progress.index
 
         self.route_progress, new_position, mins_left = network.traverse_route(
             route = self.route,
             progress = self.route_progress,
             time_step = self.model.time_step,
-            speed = speed
+            edge_times = self.route_edge_times
         )
 
-        self._remember_comfort(start_node)
+        self._remember_comfort(start_index)
 
         if new_position is None:
             # We have reached our destination
             new_position = self.model.get_location_coords(self.trip.destination)
             self.location = self.trip.destination
             self._record_journey(mins_left)
+            self.model.num_travelling_by_mode[self.route.mode] -= 1
             self._clear_travel_info()
             self._next_plan_step()
 
@@ -514,7 +571,7 @@ class PersonAgent(mg.GeoAgent):
             # e.g. time_step = 5 and trip starting at 10:12, plan at 10:05.
             if self.model.time.time_to(self.trip.start_time) < 2 * self.model.time_step:
                 self._plan_route()
-        elif self.model.time.time_to(Time(4, 0)) < self.model.time_step:
+        elif self.model.time.time_to(DAY_START) < self.model.time_step:
             # Plan for the day
             self.person.plan_day(self.model.global_info)
             self._next_plan_step()
@@ -1,5 +1,5 @@
 """Classes to help with trips and routes"""
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from transport_model.time import Time
 
 @dataclass
@@ -21,38 +21,21 @@ class Route:
     Stores information about the route a person is following.
 
     mode                The transport mode being used for this route.
-    path                List of nodes remaining in this route.
+    path                The nodes in this route. Converted to a tuple when the route is
+                        created, as a route's path doesn't change once it's planned.
+    _hash               Hash of the mode and path, computed once as routes are
+                        looked up in memory several times while being chosen.
     """
     mode: str
-    path: list[int]
+    path: tuple[int, ...]
+    _hash: int = field(init=False, repr=False, compare=False)
 
-    def from_node(self, node: int) -> list[int]:
-        """
-        Args:
-            node: The first node in the returned path.
-        
-        Returns:
-            The path from the given node onwards.
-        """
-        index = self.path.index(node)
-        return self.path[index:]
-
-    def between_nodes(self, start: int, end: int) -> list[int]:
-        """
-        Args:
-            start: First node.
-            end: Last node
-
-        Returns:
-            The path between the two provided nodes (inclusive).
-        """
-        start_index = self.path.index(start)
-        # +1 because list slicing excludes the last element
-        end_index = self.path.index(end) + 1
-        return self.path[start_index:end_index]
+    def __post_init__(self) -> None:
+        self.path = tuple(self.path)
+        self._hash = hash((self.mode, self.path))
 
     def __hash__(self):
-        return hash((self.mode, tuple(self.path)))
+        return self._hash
 
 @dataclass
 class RouteProgress:
@@ -62,9 +45,11 @@ class RouteProgress:
     node        The node the agent has got up to.
     offset      When a person is in the middle of an edge,
                 gives how far through traversing it they are (in minutes).
+    index       The position of node in the route's path.
     """
     node: int
     offset: float = 0.0
+    index: int = 0
 
 @dataclass
 class RoadType:
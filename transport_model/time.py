@@ -60,3 +60,6 @@ class Time:
             time_after_midnight = (60 * end.hour) + end.minute
             return time_before_midnight + time_after_midnight
         return (60 * (end.hour - self.hour)) + (end.minute - self.minute)
+
+# When each day in the model starts (and agents plan their day)
+DAY_START = Time(4, 0)
@@ -1,11 +1,18 @@
 """Util script to create a scenario from a real location"""
 import os
 import json
+import pickle
 import random
+import hashlib
+from collections import Counter
+from collections.abc import Callable
+from functools import lru_cache
 import osmnx as ox
 import pandas as pd
+import shapely
 from geopandas import GeoDataFrame
 from shapely import Polygon, Point
+from shapely.ops import triangulate
 
 DIRECTORY = "./scenarios/westerham/"
 
@@ -14,13 +21,39 @@ LOCATION = {
     "radius": 1250
 }
 
+# Results fetched from OSM are pickled here so they only need fetching once
+CACHE_DIRECTORY = "./cache/osm"
+
+def fetch_cached(key: tuple, fetch: Callable[[], any]) -> any:
+    """
+    Returns the result of fetch(), loading it from disk if it has been fetched before.
+
+    Args:
+        key: Identifies the request (e.g. location, radius and tags).
+        fetch: Makes the request if there's no cached result.
+    """
+    digest = hashlib.sha256(repr(key).encode()).hexdigest()
+    path = os.path.join(CACHE_DIRECTORY, f"{digest}.pkl")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    result = fetch()
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return result
+
 def create_network_of_type(network_type: str) -> None:
     """Fetches network of given type for specified location and writes it to disk"""
     # TODO: ensure graph is fully connected?
-    graph = ox.graph_from_address(
-        LOCATION["centre"],
-        dist=LOCATION["radius"],
-        network_type=network_type
+    graph = fetch_cached(
+        ("graph", LOCATION["centre"], LOCATION["radius"], network_type),
+        lambda: ox.graph_from_address(
+            LOCATION["centre"],
+            dist=LOCATION["radius"],
+            network_type=network_type
+        )
     )
     out_path = os.path.join(DIRECTORY, f"network_{network_type}.graphml")
     ox.io.save_graphml(graph, out_path)
@@ -29,10 +62,14 @@ def get_areas(landuses: list[str]) -> GeoDataFrame:
     """Fetches areas of the specified type"""
     gdf_list = []
     for landuse in landuses:
-        areas = ox.features_from_address(
-            LOCATION["centre"],
-            dist=LOCATION["radius"],
-            tags={"landuse": landuse}
+        tags = {"landuse": landuse}
+        areas = fetch_cached(
+            ("features", LOCATION["centre"], LOCATION["radius"], tags),
+            lambda tags=tags: ox.features_from_address(
+                LOCATION["centre"],
+                dist=LOCATION["radius"],
+                tags=tags
+            )
         )
         gdf_list.append(areas)
     return pd.concat(gdf_list, ignore_index=True)
@@ -45,10 +82,14 @@ def create_areas_of_types(landuses: list[str]) -> None:
 
 def get_shops_and_amenities() -> list[dict[str, any]]:
     """Fetches all named shops + amenities"""
-    features = ox.features_from_address(
-        LOCATION["centre"],
-        dist=LOCATION["radius"],
-        tags={"shop": True, "amenity": True}
+    tags = {"shop": True, "amenity": True}
+    features = fetch_cached(
+        ("features", LOCATION["centre"], LOCATION["radius"], tags),
+        lambda: ox.features_from_address(
+            LOCATION["centre"],
+            dist=LOCATION["radius"],
+            tags=tags
+        )
     )
     named_features = features[features["name"].notna()]
     return [v.dropna().to_dict() for _, v in named_features.iterrows()]
@@ -87,25 +128,86 @@ def get_shop_amenity_locations() -> dict[str, dict[str, str | float]]:
         locations[name]["description"] = get_feature_description(feature)
     return locations
 
+@lru_cache(maxsize=None)
+def triangulate_area(area: Polygon) -> tuple[list[Polygon], list[bool], list[float]]:
+    """
+    Splits an area into triangles (a Delaunay triangulation of its vertices).
+
+    Returns:
+        The triangles that overlap the area.
+        Whether each triangle is entirely within the area.
+        The cumulative size of each triangle's overlap with the area.
+    """
+    # The triangles of a convex area without holes are all within it,
+    # so the overlap of each triangle doesn't need computing
+    # (other geometries, e.g. MultiPolygons, are treated as non-convex)
+    convex = (
+        isinstance(area, Polygon)
+        and not area.interiors
+        and area.equals(area.convex_hull)
+    )
+    triangles = []
+    inside = []
+    cumulative_areas = []
+    total_area = 0.0
+    for triangle in triangulate(area):
+        overlap = triangle.area if convex else triangle.intersection(area).area
+        if overlap > 0:
+            total_area += overlap
+            triangles.append(triangle)
+            inside.append(convex or triangle.within(area))
+            cumulative_areas.append(total_area)
+    return triangles, inside, cumulative_areas
+
+def get_random_point_in_triangle(triangle: Polygon) -> Point:
+    """Returns a uniformly random point within the triangle"""
+    (ax, ay), (bx, by), (cx, cy) = triangle.exterior.coords[:3]
+    r1, r2 = random.random(), random.random()
+    if r1 + r2 > 1:
+        # Reflect points from the other half of the parallelogram back into the triangle
+        r1, r2 = 1 - r1, 1 - r2
+    return Point(ax + r1 * (bx - ax) + r2 * (cx - ax), ay + r1 * (by - ay) + r2 * (cy - ay))
+
+def get_random_points(area: Polygon, num: int) -> list[Point]:
+    """Returns the specified number of random points within this area"""
+    triangles, inside, cumulative_areas = triangulate_area(area)
+    if not triangles:
+        # Degenerate area (e.g. zero width) with nothing to sample from
+        return [area.representative_point()] * num
+    chosen = random.choices(range(len(triangles)), cum_weights=cumulative_areas, k=num)
+    points = [get_random_point_in_triangle(triangles[i]) for i in chosen]
+
+    # Triangles only partly within a concave area need points outside it rejecting
+    # (all points are checked in a single call)
+    shapely.prepare(area)
+    to_check = [j for j, i in enumerate(chosen) if not inside[i]]
+    while to_check:
+        valid = shapely.contains(area, [points[j] for j in to_check])
+        to_check = [j for j, is_valid in zip(to_check, valid) if not is_valid]
+        for j in to_check:
+            points[j] = get_random_point_in_triangle(triangles[chosen[j]])
+    return points
+
 def get_random_point(area: Polygon) -> Point:
     """Returns a random point within this area"""
-    min_x, min_y, max_x, max_y = area.bounds
-    point = None
-    while not (point and point.within(area)):
-        point = Point(random.uniform(min_x, max_x), random.uniform(min_y, max_y))
-    return point
+    return get_random_points(area, 1)[0]
 
 def get_houses(num: int) -> dict[str, dict[str, str | float]]:
     """Creates the specified number of houses"""
     residential_areas = get_areas(["residential"])
     row_indices = range(residential_areas.shape[0])
-    weights = [row["geometry"].area for _, row in residential_areas.iterrows()]
+    weights = [geometry.area for geometry in residential_areas.geometry]
     areas_to_choose = random.choices(row_indices, weights=weights, k=num)
 
+    # Generate the points for each area together
+    area_points = {
+        area_index: iter(get_random_points(residential_areas.loc[area_index, "geometry"], count))
+        for area_index, count in Counter(areas_to_choose).items()
+    }
+
     houses = {}
     for i, area_index in enumerate(areas_to_choose):
-        area = residential_areas.loc[area_index, "geometry"]
-        geometry = get_random_point(area)
+        geometry = next(area_points[area_index])
         houses[f"House {i}"] = {
             "lat": geometry.y,
             "long": geometry.x,
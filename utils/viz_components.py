@@ -2,23 +2,30 @@
 import solara
 from transport_model.model import TransportModel
 from transport_model.person import PersonAgent
+from transport_model.routes import Trip
+from transport_model.memory import ModeChoice
 from transport_model.time import Time
 
-def agent_mode_view(agent: PersonAgent) -> solara.Text:
-    """Displays information about the provided agent's travel mode"""
-    if not agent.is_travelling():
+# The agent views below are components that take plain values rather than the agent,
+# so Solara only re-renders them when the values they display have changed.
+
+@solara.component
+def agent_mode_view(mode: str | None) -> solara.Text:
+    """Displays information about an agent's travel mode (None if not travelling)"""
+    if mode is None:
         return solara.Text("Not currently travelling")
-    return solara.Text(f"Travelling with mode: {agent.get_current_mode()}")
+    return solara.Text(f"Travelling with mode: {mode}")
 
-def agent_trip_view(agent: PersonAgent) -> solara.Details:
-    """Displays information about the provided agent's planned trip"""
-    if agent.trip is None:
+@solara.component
+def agent_trip_view(trip: Trip | None) -> solara.Details:
+    """Displays information about an agent's planned trip"""
+    if trip is None:
         content = solara.Text("No trip planned")
     else:
         content = solara.Column(children=[
-            solara.Text(f"Origin: {agent.trip.origin}"),
-            solara.Text(f"Destination: {agent.trip.destination}"),
-            solara.Text(f"Start time: {agent.trip.start_time}")
+            solara.Text(f"Origin: {trip.origin}"),
+            solara.Text(f"Destination: {trip.destination}"),
+            solara.Text(f"Start time: {trip.start_time}")
         ])
     return solara.Details(
         summary="Next trip:",
@@ -30,23 +37,25 @@ def plan_entry_text(entry: tuple[Time, str]) -> solara.Text:
     time, action = entry
     return solara.Text(f"{time} - {action}")
 
-def agent_plan_view(agent: PersonAgent) -> solara.Details:
-    """Displays information about the provided agent's daily plan"""
-    if not agent.person.daily_plan:
+@solara.component
+def agent_plan_view(plan: tuple[tuple[Time, str], ...]) -> solara.Details:
+    """Displays the remaining entries in an agent's daily plan"""
+    if not plan:
         content = solara.Text("Plan is empty")
     else:
         content = solara.Column(children=[
-            plan_entry_text(entry) for entry in agent.person.daily_plan
+            plan_entry_text(entry) for entry in plan
         ])
     return solara.Details(
         summary="Remaining daily plan:",
         children=[content]
     )
 
-def agent_mode_choice_view(agent: PersonAgent) -> solara.Details:
+@solara.component
+def agent_mode_choice_view(choices: tuple[ModeChoice, ...]) -> solara.Details:
     """Displays justifications given for mode choices"""
     lines = []
-    for choice in agent.memory.justifications:
+    for choice in choices:
         context = solara.Markdown((
             f"**Day {choice.day} {choice.time}  -  "
             f"{choice.origin} > {choice.destination} ({choice.mode})**"
@@ -66,27 +75,25 @@ def selected_agent_card(model: TransportModel) -> solara.Card:
         return solara.Card(title="No agent selected")
 
     components = solara.Column(children=[
-        agent_mode_view(agent),
-        agent_trip_view(agent),
-        agent_plan_view(agent),
-        agent_mode_choice_view(agent)
+        agent_mode_view(agent.get_current_mode()),
+        agent_trip_view(agent.trip),
+        agent_plan_view(tuple(agent.person.daily_plan)),
+        agent_mode_choice_view(tuple(agent.memory.justifications))
     ])
 
     card = solara.Card(
         title=f"Selected agent: {agent.person.name}",
         children=[components]
     )
-    return card
+    # Only rebuild the card from scratch when a different agent is selected
+    return card.key(f"selected-agent-{agent.unique_id}")
 
 def model_info(model: TransportModel) -> solara.Column:
     """Displays global information about the model"""
     num_agents = len(model.agents_by_type[PersonAgent])
-    num_travelling = len(
-        [agent for agent in model.agents_by_type[PersonAgent] if agent.is_travelling()]
-    )
     agent_counts = solara.Column(children=[
         solara.Text(f"{num_agents} Agent(s) Total"),
-        solara.Text(f"{num_travelling} Agent(s) Travelling")
+        solara.Text(f"{model.num_travelling} Agent(s) Travelling")
     ])
     return solara.Card(
         title=f"Day: {model.day} {model.time}",